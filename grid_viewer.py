@@ -1,10 +1,14 @@
+import argparse
 import json
+import os
 
 from compas.colors import Color, ColorMap
-from compas.geometry import Box, Frame, Sphere
-from compas_viewer import Viewer
+from compas.datastructures import Mesh
+from compas.geometry import Box, Frame, Point, Sphere, Translation
 
 from data_structures import FactoryLayout, Machine
+from lod import AGGREGATE, DETAIL, OVERVIEW, QueueCounts, choose_level
+from utilization import DEFAULT_BINS, UtilizationHistory
 from visualize import machines_to_geometry
 
 
@@ -24,6 +28,38 @@ WORKPIECE_COLOR = Color.from_rgb255(255, 230, 50)
 HEAT_LOW = Color.from_rgb255(176, 196, 222)   # light steel blue
 HEAT_HIGH = Color.from_rgb255(240, 128, 128)  # light coral
 MACHINE_ALPHA = 0.40
+BOX_REFRESH_FRAMES = 20          # 游標在最新一格時，每幾幀（20 幀 = 1 秒）重算 box 的視窗平均
+
+# Timeline strip（地板下方，每列一台機台、每格一個時間 bin）
+TIMELINE_ROW_HEIGHT = 0.30
+TIMELINE_GAP = 0.60               # 與地板之間的距離
+TIMELINE_Z = 0.04                 # strip 高度（離地）
+TIMELINE_EMPTY_COLOR = Color.from_rgb255(235, 235, 235)   # 還沒有資料的格子
+TIMELINE_CURSOR_COLOR = Color.from_rgb255(60, 60, 60)
+
+# Level of detail（工件很多或鏡頭拉很遠時，改畫彙總 queue bar）
+TILE_COLOR = Color.from_rgb255(235, 235, 235)
+LOD_AGENT_THRESHOLD = 200         # 工件數 >= 此值不畫球，改畫 queue bar
+LOD_CAMERA_DISTANCE = 60.0        # 鏡頭距離 >= 此值再合併地板、收起 timeline strip
+QUEUE_BAR_SIZE = 0.6              # bar 底面邊長
+QUEUE_BAR_UNIT = 0.15             # 每個工件的 bar 高度
+QUEUE_BAR_BASE = 0.05             # 沒有工件時的 bar 高度（仍看得到位置）
+QUEUE_BAR_COLOR = Color.from_rgb255(255, 230, 50)
+QUEUE_TAG_COLOR = Color.from_rgb255(40, 40, 40)
+COUNT_PANEL_FRAMES = 20           # 計數有變動時，side panel 最多每幾幀更新一次
+
+# Tag 預設字型（FreeSans）沒有中文字：依序找系統上的中文字型，都沒有就改用 ASCII 標籤
+CJK_FONT_CANDIDATES = [
+    "C:/Windows/Fonts/msjh.ttc",                                 # 微軟正黑體
+    "C:/Windows/Fonts/msyh.ttc",
+    "C:/Windows/Fonts/mingliu.ttc",
+    "/System/Library/Fonts/PingFang.ttc",
+    "/System/Library/Fonts/STHeiti Medium.ttc",
+    "/Library/Fonts/Arial Unicode.ttf",
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",
+]
 
 
 # ============================================================
@@ -43,15 +79,26 @@ def get_types_order(config):
     """依 machines 出現順序蒐集 type，保持欄位順序穩定。"""
     types = []
     for m in config.get("machines", []):
-        if isinstance(m, str):
-            t = m
-        else:
-            t = m.get("type") or m.get("name")
+        t = machine_type(m)
         if t not in types:
             types.append(t)
     return types
 
 
+def machine_type(m):
+    """machines 中一台機台的種類：舊格式字串本身就是 type，新格式沒給 type 時用 name。"""
+    if isinstance(m, str):
+        return m
+    return m.get("type") or m.get("name")
+
+
+def step_type(step):
+    """route 中一站的機台種類：新格式 {"type": ..., "duration": ...}，舊格式直接是字串。"""
+    if isinstance(step, str):
+        return step
+    return step.get("type")
+
+
 def group_machines_by_type(config, types_order):
     """把 machines 分組成 {type: [machine_dict, ...]}。
 
@@ -71,7 +118,7 @@ def group_machines_by_type(config, types_order):
             out.setdefault(t, []).append({"name": name, "type": t, "speed": speed})
         else:
             name = m["name"]
-            t = m.get("type") or name
+            t = machine_type(m)
             speed = float(m.get("speed", 1.0))
             out.setdefault(t, []).append({"name": name, "type": t, "speed": speed})
 
@@ -142,11 +189,226 @@ def build_layout_by_type_grid(config):
 
 
 # ============================================================
-# Heatmap loading（目前先回傳 0，之後可改成：指派次數 / 等候時間 / utilization）
+# Heatmap loading：依時間視窗的 utilization（0~1）
+# ============================================================
+
+def utilization_color(cmap, value):
+    color = cmap(value, minval=0.0, maxval=1.0)
+    color.a = MACHINE_ALPHA
+    return color
+
+
+def add_machine_boxes(viewer, machine_boxes, cmap):
+    """機台 box 只建立一次，之後用 recolor_machine_boxes 原地改顏色。
+
+    回傳 {name: scene_object}。
+    """
+    objs = {}
+    for name, box in machine_boxes.items():
+        objs[name] = viewer.scene.add(
+            box,
+            name=name,
+            surfacecolor=utilization_color(cmap, 0.0),
+            show_lines=True,
+            show_points=False,
+        )
+    return objs
+
+
+def recolor_machine_boxes(objs, loads, cmap):
+    # 只更新顏色 buffer，不移除 / 重建物件（重建會觸發整個場景的 rebuild_buffers）
+    for name, obj in objs.items():
+        obj.surfacecolor = utilization_color(cmap, loads.get(name, 0.0))
+        obj.update(update_data=True)
+
+
+def add_timeline_strip(viewer, nrows, bins, origin, width):
+    """utilization timeline：列 = 機台，欄 = 時間 bin（左舊右新）。
+
+    整條 strip 是一個 Mesh（每格一個 face），加上一個游標 box；都只建立一次。
+    origin: strip 左上角 (x, y)。回傳 (strip_obj, cursor_obj)。
+    """
+    cell_w = width / bins
+    x0, y0 = origin
+
+    vertices = []
+    faces = []
+    for i in range(nrows):
+        y_top = y0 - (i + 0.05) * TIMELINE_ROW_HEIGHT
+        y_bot = y0 - (i + 0.95) * TIMELINE_ROW_HEIGHT
+        for col in range(bins):
+            xa = x0 + (col + 0.025) * cell_w
+            xb = x0 + (col + 0.975) * cell_w
+            v = len(vertices)
+            vertices += [
+                (xa, y_bot, TIMELINE_Z),
+                (xb, y_bot, TIMELINE_Z),
+                (xb, y_top, TIMELINE_Z),
+                (xa, y_top, TIMELINE_Z),
+            ]
+            faces.append([v, v + 1, v + 2, v + 3])   # face key = i * bins + col
+
+    strip = Mesh.from_vertices_and_faces(vertices, faces)
+    strip_obj = viewer.scene.add(
+        strip,
+        name="Timeline",
+        facecolor={f: TIMELINE_EMPTY_COLOR for f in strip.faces()},
+        show_lines=False,
+        show_points=False,
+    )
+
+    # 游標：建立在最新一格（最右邊），scrub 時用 transformation 平移
+    x = x0 + (bins - 0.5) * cell_w
+    cursor = Box(
+        frame=Frame((x, y0 - 0.5 * nrows * TIMELINE_ROW_HEIGHT, TIMELINE_Z), (1, 0, 0), (0, 1, 0)),
+        xsize=cell_w,
+        ysize=nrows * TIMELINE_ROW_HEIGHT,
+        zsize=TIMELINE_Z,
+    )
+    cursor_obj = viewer.scene.add(
+        cursor,
+        name="Timeline_cursor",
+        surfacecolor=TIMELINE_CURSOR_COLOR,
+        opacity=0.35,
+        show_lines=True,
+        show_points=False,
+    )
+    return strip_obj, cursor_obj
+
+
+def update_timeline_strip(strip_obj, history, window, cmap):
+    """依 history 重新上色（一次更新整個 mesh 的顏色 buffer）。"""
+    _, matrix = history.timeline(window)
+    nfilled = matrix.shape[1]
+    bins = history.bins
+
+    colors = {}
+    for i in range(len(history.machine_names)):
+        for col in range(bins):
+            # 靠右對齊：最新一格永遠在最右邊
+            k = col - (bins - nfilled)
+            if k < 0:
+                colors[i * bins + col] = TIMELINE_EMPTY_COLOR
+            else:
+                colors[i * bins + col] = cmap(float(matrix[i, k]), minval=0.0, maxval=1.0)
+
+    strip_obj.facecolor = colors
+    strip_obj.update(update_data=True)
+
+
+def move_timeline_cursor(cursor_obj, offset, cell_w):
+    cursor_obj.transformation = Translation.from_vector([-offset * cell_w, 0.0, 0.0])
+    cursor_obj.update()
+
+
+# ============================================================
+# Level of detail：地板（逐欄 / 合併）與彙總 queue bar
 # ============================================================
 
-def compute_machine_loads_zero(layout):
-    return {name: 0.0 for name in layout.machines.keys()}
+def add_floors(viewer, types_order, grid_pos, merged_y):
+    """兩種地板都只建立一次，切換 LOD 時只改 show：
+
+    - tiles：每一欄(type)一整塊（DETAIL / AGGREGATE）
+    - merged：整個網格合併成一塊（OVERVIEW）
+    回傳 (tile_objs, merged_obj)。
+    """
+    def add_tile(name, x, width, show):
+        tile = Box(
+            frame=Frame((x, 0.0, 0.0), (1, 0, 0), (0, 1, 0)),
+            xsize=width,
+            ysize=merged_y,
+            zsize=TILE_SIZE[2],
+        )
+        return viewer.scene.add(
+            tile,
+            name=name,
+            show=show,
+            surfacecolor=TILE_COLOR,
+            show_lines=True,
+            show_points=False,
+        )
+
+    # 欄中心 x：取 (t,0) 的位置
+    tile_objs = [add_tile(f"Tile_{t}", grid_pos[(t, 0)][0], TILE_SIZE[0], True) for t in types_order]
+
+    xs = [grid_pos[(t, 0)][0] for t in types_order] or [0.0]
+    width = (max(xs) - min(xs)) + TILE_SIZE[0]
+    merged_obj = add_tile("Floor", 0.5 * (max(xs) + min(xs)), width, False)
+    return tile_objs, merged_obj
+
+
+def queue_bar_corners(base, count):
+    """一根 bar 的 8 個角點；高度 = QUEUE_BAR_BASE + count × QUEUE_BAR_UNIT（count=0 時是一片薄板）。"""
+    x, y, z = base
+    h = QUEUE_BAR_BASE + max(count, 0) * QUEUE_BAR_UNIT
+    r = QUEUE_BAR_SIZE / 2.0
+    return [
+        (x - r, y - r, z), (x + r, y - r, z), (x + r, y + r, z), (x - r, y + r, z),
+        (x - r, y - r, z + h), (x + r, y - r, z + h), (x + r, y + r, z + h), (x - r, y + r, z + h),
+    ]
+
+
+def add_queue_bars(viewer, name, bases):
+    """所有 bar 合成一個 Mesh（每根 8 點 6 面），之後用 set_queue_bar 原地改高度。
+
+    回傳 (scene_object, mesh)。
+    """
+    vertices = []
+    faces = []
+    for base in bases:
+        v = len(vertices)
+        vertices += queue_bar_corners(base, 0)
+        faces += [
+            [v, v + 3, v + 2, v + 1],
+            [v + 4, v + 5, v + 6, v + 7],
+            [v, v + 1, v + 5, v + 4],
+            [v + 1, v + 2, v + 6, v + 5],
+            [v + 2, v + 3, v + 7, v + 6],
+            [v + 3, v, v + 4, v + 7],
+        ]
+    mesh = Mesh.from_vertices_and_faces(vertices, faces)
+    obj = viewer.scene.add(mesh, name=name, show=False, facecolor=QUEUE_BAR_COLOR, show_points=False)
+    return obj, mesh
+
+
+def set_queue_bar(mesh, index, base, count):
+    for j, xyz in enumerate(queue_bar_corners(base, count)):
+        mesh.vertex_attributes(index * 8 + j, "xyz", xyz)
+
+
+def find_label_font(texts, path=None):
+    """回傳能畫出 texts 中所有非 ASCII 字元的字型路徑（先試 path，再試 CJK_FONT_CANDIDATES）。
+
+    全部是 ASCII 或找不到合適字型時回傳 None：前者用 Tag 預設字型即可，
+    後者呼叫端要改用 ASCII 標籤（預設字型畫中文只會是空白）。
+    """
+    chars = {c for text in texts for c in str(text) if not c.isascii()}
+    if not chars:
+        return None
+
+    from freetype import Face, FT_Exception   # compas_viewer 的相依套件，只有 viewer 用得到
+
+    for candidate in ([path] if path else []) + CJK_FONT_CANDIDATES:
+        if not os.path.isfile(candidate):
+            continue
+        try:
+            face = Face(candidate)
+        except FT_Exception:
+            continue
+        if all(face.get_char_index(ord(c)) for c in chars):
+            return candidate
+    return None
+
+
+def format_queue_counts(counts, types_order, labels, machines_by_type):
+    """side panel 的計數文字：每種機台一行（等待 / 機台上），底下列出每台機台的工件數。"""
+    lines = []
+    for t in types_order:
+        name = labels[t] if labels[t] == str(t) else f"{labels[t]}（{t}）"
+        lines.append(f"{name}：等待 {counts.waiting.get(t, 0)}｜機台上 {counts.at_type.get(t, 0)}")
+        for m in machines_by_type.get(t, []):
+            lines.append(f"    {m.name}：{counts.at_machine[m.name]}")
+    return "\n".join(lines)
 
 
 # ============================================================
@@ -154,13 +416,34 @@ def compute_machine_loads_zero(layout):
 # ============================================================
 
 class WorkpieceAgent:
-    def __init__(self, wid, route_steps, layout, viewer, color, start_pos, move_speed=4.0):
+    def __init__(
+        self,
+        wid,
+        route_steps,
+        layout,
+        viewer,
+        color,
+        start_pos,
+        move_speed=4.0,
+        events=None,
+        verbose=True,
+        visible=True,
+    ):
+        """
+        viewer: compas_viewer.Viewer；傳 None 代表 headless（不畫球，只跑派工）
+        events: 事件紀錄 list，會 append (time, wid, event, machine_name)
+        verbose: 是否 print 指派 / 完成訊息
+        visible: 是否畫球（彙總模式下不畫，位置仍照常更新）
+        """
         self.wid = wid
         self.route_steps = route_steps
         self.layout = layout
         self.viewer = viewer
         self.color = color
         self.move_speed = move_speed
+        self.events = events
+        self.verbose = verbose
+        self.visible = visible
 
         self.step_index = 0
         self.state = "need_assign"   # need_assign / moving / processing / finished
@@ -171,6 +454,7 @@ class WorkpieceAgent:
         self.target_pos = list(start_pos)
 
         self.current_obj = None
+        self.drawn_pos = list(start_pos)
         self._draw()
 
     def current_step(self):
@@ -178,7 +462,32 @@ class WorkpieceAgent:
             return None
         return self.route_steps[self.step_index]
 
+    def _log(self, now, event, machine=None):
+        if self.events is not None:
+            name = machine.name if machine is not None else None
+            self.events.append((now, self.wid, event, name))
+
+    def set_visible(self, visible):
+        """切換 LOD 用：只改 show，不移除 / 重建物件（重建會觸發整個場景的 rebuild_buffers）。"""
+        if visible == self.visible:
+            return
+        self.visible = visible
+        if self.current_obj is None:
+            return
+
+        self.current_obj.show = visible
+        if visible:
+            # 隱藏期間位置可能變了：用 transformation 平移到目前位置
+            offset = [self.pos[i] - self.drawn_pos[i] for i in range(3)]
+            self.current_obj.transformation = Translation.from_vector(offset)
+            self.current_obj.update()
+
     def _draw(self):
+        if self.viewer is None:
+            return
+        if self.current_obj is not None and not self.visible:
+            return   # 隱藏中：位置照常更新，重新顯示時再平移過去
+
         # COMPAS 2.15：穩定作法：移除舊物件、重建新球
         if self.current_obj is not None:
             self.viewer.scene.remove(self.current_obj)
@@ -188,15 +497,19 @@ class WorkpieceAgent:
         self.current_obj = self.viewer.scene.add(
             sphere,
             name=f"wp_{self.wid}",
+            show=self.visible,
             surfacecolor=self.color,
             show_lines=True,
         )
+        self.drawn_pos = list(self.pos)
 
     def try_assign(self, now, machines_by_type):
         step = self.current_step()
         if step is None:
             self.state = "finished"
-            print(f"{self.wid} 完成所有工序")
+            self._log(now, "finished")
+            if self.verbose:
+                print(f"{self.wid} 完成所有工序")
             return
 
         target_type = step["type"]
@@ -222,10 +535,12 @@ class WorkpieceAgent:
         x, y, z = chosen.position
         self.target_pos = [x, y, z + 0.1]
 
-        print(
-            f"{self.wid} 指派到：{chosen.name} "
-            f"(type={chosen.type}, speed={chosen.speed})｜加工時間：{actual:.2f}s"
-        )
+        self._log(now, "assign", chosen)
+        if self.verbose:
+            print(
+                f"{self.wid} 指派到：{chosen.name} "
+                f"(type={chosen.type}, speed={chosen.speed})｜加工時間：{actual:.2f}s"
+            )
 
         self.state = "moving"
 
@@ -246,113 +561,84 @@ class WorkpieceAgent:
 
             if all(abs(self.pos[i] - self.target_pos[i]) < 0.03 for i in range(3)):
                 self.state = "processing"
+                self._log(now, "arrive", self.current_machine)
             return
 
         if self.state == "processing":
             self.process_remaining -= dt
             if self.process_remaining <= 0:
                 self.step_index += 1
+                self._log(now, "release", self.current_machine)
                 if self.step_index >= len(self.route_steps):
                     self.state = "finished"
-                    print(f"{self.wid} 完成所有工序")
+                    self._log(now, "finished")
+                    if self.verbose:
+                        print(f"{self.wid} 完成所有工序")
                 else:
                     self.state = "need_assign"
             return
 
 
 # ============================================================
-# 主程式
+# 派工 helper（viewer 與 headless simulation 共用）
 # ============================================================
 
-def main():
-    config = load_config()
-
-    # 1) 依 type-grid 建立 layout
-    layout, types_order, rows, grid_pos = build_layout_by_type_grid(config)
-
-    # 2) 回合制派工用：machines_by_type（由上到下順序：name 排序）
+def group_layout_by_type(layout):
+    """回合制派工用：{type: [Machine, ...]}（由上到下順序：name 排序）。"""
     machines_by_type = {}
     for m in layout.machines.values():
         machines_by_type.setdefault(m.type, []).append(m)
     for t in machines_by_type:
         machines_by_type[t].sort(key=lambda mm: mm.name)
+    return machines_by_type
 
-    # 3) heatmap loads（先全部 0）
-    machine_loads = compute_machine_loads_zero(layout)
-
-    # 4) viewer
-    viewer = Viewer(rendermode="shaded")
-
-    # --------------------------------------------------------
-    # A. 畫「合併地板」：每一欄(type)一整塊，往下覆蓋 rows 格
-    # --------------------------------------------------------
-    row_step = TILE_SIZE[1] + GAP_Y
-    merged_y = rows * TILE_SIZE[1] + (rows - 1) * GAP_Y
-
-    for t in types_order:
-        # 欄中心 x：取 (t,0) 的位置
-        x, _, _ = grid_pos[(t, 0)]
-        center = (x, 0.0, 0.0)
-
-        tile = Box(
-            frame=Frame(center, (1, 0, 0), (0, 1, 0)),
-            xsize=TILE_SIZE[0],
-            ysize=merged_y,
-            zsize=TILE_SIZE[2],
-        )
-
-        viewer.scene.add(
-            tile,
-            name=f"Tile_{t}",
-            surfacecolor=Color.from_rgb255(235, 235, 235),
-            show_lines=True,
-            show_points=False,
-        )
-
-    # --------------------------------------------------------
-    # B. 畫機台 box（依 load 著色，可透）
-    # --------------------------------------------------------
-    loads_values = list(machine_loads.values())
-    min_load = min(loads_values) if loads_values else 0.0
-    max_load = max(loads_values) if loads_values else 1.0
-    if max_load == min_load:
-        max_load = min_load + 1.0
-
-    cmap = ColorMap.from_two_colors(HEAT_LOW, HEAT_HIGH)
-
-    machine_boxes = machines_to_geometry(layout)
-    for name, box in machine_boxes.items():
-        load = machine_loads.get(name, 0.0)
-        color = cmap(load, minval=min_load, maxval=max_load)
-        color.a = MACHINE_ALPHA
-
-        viewer.scene.add(
-            box,
-            name=f"{name} (load={load:.1f})",
-            surfacecolor=color,
-            show_lines=True,
-            show_points=False,
-        )
 
-    # --------------------------------------------------------
-    # C. 產生工件（quantity 會產生多顆）
-    #    起點：放在最左側一個 staging 區（不在地板上）
-    # --------------------------------------------------------
+def staging_position(types_order):
+    """工件起點：最左側一個 staging 區（不在地板上），回傳 (x, z)。"""
     ncols = max(len(types_order), 1)
     col_step = TILE_SIZE[0] + GAP_X
     staging_x = -0.5 * (ncols - 1) * col_step - (TILE_SIZE[0] * 0.9)
     staging_z = (TILE_SIZE[2] / 2.0) + (MACHINE_SIZE[2] / 2.0) + 0.1
+    return staging_x, staging_z
+
+
+def create_agents(
+    config,
+    layout,
+    types_order,
+    viewer,
+    product_indices=None,
+    events=None,
+    verbose=True,
+    visible=True,
+):
+    """依 products 產生工件（quantity 會產生多顆）。
+
+    product_indices: 只產生這些 index 的產品（None = 全部），給分區模擬用。
+    """
+    staging_x, staging_z = staging_position(types_order)
 
     agents = []
     products = config.get("products", [])
+    if product_indices is None:
+        product_indices = range(len(products))
 
+    # 工件 id 必須唯一（事件紀錄與統計都以 id 為 key）；
+    # config.html 不會擋重複的產品名稱，重名時在 id 裡加上產品序號
+    name_count = {}
     for p in products:
+        pname = p.get("name", "P")
+        name_count[pname] = name_count.get(pname, 0) + 1
+
+    for pi in product_indices:
+        p = products[pi]
         pname = p.get("name", "P")
         qty = int(p.get("quantity", 1))
         route_steps = p.get("route", [])  # [{"type":..., "duration":...}, ...]
+        prefix = pname if name_count[pname] == 1 else f"{pname}#{pi+1}"
 
         for k in range(qty):
-            wid = f"{pname}-{k+1}"
+            wid = f"{prefix}-{k+1}"
             # y 方向稍微錯開，避免全部疊在一起（不做碰撞，只是視覺好看）
             start_pos = (staging_x, 0.4 * k, staging_z)
             agent = WorkpieceAgent(
@@ -363,44 +649,321 @@ def main():
                 WORKPIECE_COLOR,
                 start_pos=start_pos,
                 move_speed=4.0,
+                events=events,
+                verbose=verbose,
+                visible=visible,
             )
             agents.append(agent)
 
+    return agents
+
+
+def dispatch_tick(agents, dt, now, machines_by_type):
+    """推進一個回合（三個 phase 的順序不能換）。"""
+    # Phase 1: 先讓正在加工的工件扣時間、完成就離開（釋放機台）
+    for a in agents:
+        if a.state == "processing":
+            a.step(dt, now, machines_by_type)
+
+    # Phase 2: 再讓需要指派的工件進站（此時機台已經釋放）
+    for a in agents:
+        if a.state == "need_assign":
+            a.try_assign(now, machines_by_type)
+
+    # Phase 3: 最後處理移動（畫面更新）
+    for a in agents:
+        if a.state == "moving":
+            a.step(dt, now, machines_by_type)
+
+
+# ============================================================
+# 主程式
+# ============================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="工廠佈局 + heatmap + 派工動畫")
+    parser.add_argument("config", nargs="?", default="config.json",
+                        help="設定檔（例如 layout_optimizer 輸出的 config_optimized.json）")
+    args = parser.parse_args()
+
+    # viewer 相關 import 放在這裡：headless simulation 只需要上面的派工邏輯
+    from compas_viewer import Viewer
+    from compas_viewer.components import Component, Slider
+    from compas_viewer.scene import Tag
+    from PySide6.QtWidgets import QLabel
+
+    config = load_config(args.config)
+
+    # 1) 依 type-grid 建立 layout
+    layout, types_order, rows, grid_pos = build_layout_by_type_grid(config)
+
+    # 2) 回合制派工用：machines_by_type（由上到下順序：name 排序）
+    machines_by_type = group_layout_by_type(layout)
+
+    # 3) utilization 歷史（每個時間視窗一個 ring buffer）
+    util_cfg = config.get("utilization", {})
+    history = UtilizationHistory(
+        list(layout.machines.keys()),
+        windows=util_cfg.get("windows"),
+        bins=int(util_cfg.get("bins", DEFAULT_BINS)),
+    )
+    window_names = list(history.windows.keys())
+    color_by = util_cfg.get("color_by", window_names[0])
+    view = {
+        "window": color_by if color_by in history.windows else window_names[0],
+        "offset": 0,   # timeline scrub：0 = 最新一格
+    }
+
+    # 4) viewer
+    viewer = Viewer(rendermode="shaded")
+
+    # --------------------------------------------------------
+    # A. 畫「合併地板」：每一欄(type)一整塊，往下覆蓋 rows 格
+    #    （OVERVIEW 改顯示整個網格合併成的一塊）
+    # --------------------------------------------------------
+    merged_y = rows * TILE_SIZE[1] + (rows - 1) * GAP_Y
+    tile_objs, merged_floor_obj = add_floors(viewer, types_order, grid_pos, merged_y)
+
+    # --------------------------------------------------------
+    # B. 畫機台 box（依目前視窗的 utilization 著色，可透）
+    #    + 地板下方的 timeline strip（可拖曳 scrub）
+    # --------------------------------------------------------
+    cmap = ColorMap.from_two_colors(HEAT_LOW, HEAT_HIGH)
+
+    machine_boxes = machines_to_geometry(layout)
+    machine_objs = add_machine_boxes(viewer, machine_boxes, cmap)
+
+    ncols = max(len(types_order), 1)
+    col_step = TILE_SIZE[0] + GAP_X
+    timeline_width = ncols * TILE_SIZE[0] + (ncols - 1) * GAP_X
+    timeline_origin = (
+        -0.5 * (ncols - 1) * col_step - 0.5 * TILE_SIZE[0],
+        -0.5 * merged_y - TIMELINE_GAP,
+    )
+    strip_obj, cursor_obj = add_timeline_strip(
+        viewer, len(history.machine_names), history.bins, timeline_origin, timeline_width
+    )
+
+    def redraw_boxes():
+        # 機台 box 顯示「游標往前一整個視窗」的平均 utilization（offset 0 = 到現在為止）；
+        # 單一格太短（60s 視窗每格 1 秒）只會是 0 / 1，strip 才逐格顯示
+        loads = history.window_utilization(view["window"], view["offset"])
+        recolor_machine_boxes(machine_objs, loads, cmap)
+
+    def redraw_heatmap(strip=True):
+        # OVERVIEW 時 strip 收起來，只重畫機台 box
+        if strip:
+            update_timeline_strip(strip_obj, history, view["window"], cmap)
+        redraw_boxes()
+
+    redraw_heatmap()
+
+    def on_window_change(slider, value):
+        view["window"] = window_names[int(value)]
+        print(f"heatmap 視窗：{view['window']}")
+        redraw_heatmap()
+
+    def on_scrub(slider, value):
+        # strip 內容不變，只移游標、改機台顏色
+        view["offset"] = int(value)
+        move_timeline_cursor(cursor_obj, view["offset"], timeline_width / history.bins)
+        redraw_boxes()
+
+    viewer.config.ui.sidedock.show = True
+    viewer.ui.sidedock.add(
+        Slider(
+            value=window_names.index(view["window"]),
+            title="Heatmap 視窗（" + " / ".join(window_names) + "）",
+            min_val=0,
+            max_val=max(len(window_names) - 1, 0),
+            step=1,
+            action=on_window_change,
+        )
+    )
+    viewer.ui.sidedock.add(
+        Slider(
+            value=0,
+            title="Timeline（往前幾格，0 = 最新）",
+            min_val=0,
+            max_val=history.bins - 1,
+            step=1,
+            action=on_scrub,
+        )
+    )
+
+    # --------------------------------------------------------
+    # C. 產生工件（quantity 會產生多顆）
+    #    起點：放在最左側一個 staging 區（不在地板上）
+    # --------------------------------------------------------
+    # 工件總數事先就知道，超過門檻時一開始就不畫球
+    lod_cfg = config.get("lod", {})
+    lod_mode = lod_cfg.get("mode", "auto")   # auto / detail / aggregate / overview
+    agent_threshold = lod_cfg.get("agent_threshold", LOD_AGENT_THRESHOLD)
+    distance_threshold = lod_cfg.get("camera_distance", LOD_CAMERA_DISTANCE)
+    total_agents = sum(int(p.get("quantity", 1)) for p in config.get("products", []))
+
+    def pick_level(current):
+        if lod_mode in (DETAIL, AGGREGATE, OVERVIEW):
+            return lod_mode
+        return choose_level(
+            current,
+            total_agents,
+            viewer.renderer.camera.distance,
+            agent_threshold,
+            distance_threshold,
+        )
+
+    level = pick_level(DETAIL)
+    events = []
+    agents = create_agents(
+        config, layout, types_order, viewer, events=events, visible=(level == DETAIL)
+    )
+
     print("types_order:", types_order)
     print("rows:", rows)
     print("總工件數:", len(agents))
 
     # --------------------------------------------------------
-    # D. 動畫更新（回合制）
+    # D. 彙總 queue bar：由派工事件增量更新，不必每幀掃過所有工件
+    #    - 每種機台一根（欄的上方）：等待該種機台的工件數
+    #    - 每台機台一根（機台頂上）：已指派、前往中或加工中的工件數
+    # --------------------------------------------------------
+    counts = QueueCounts(layout)
+    counts.add_agents(agents)
+
+    # bar 幾何只建立一次：每種機台一根、每台機台一根，各自合成一個 mesh
+    top_y = 0.5 * merged_y + 0.5 * TILE_SIZE[1]
+    machine_top = TILE_SIZE[2] / 2.0 + MACHINE_SIZE[2]
+    machine_names = list(layout.machines)
+
+    type_bases = [(grid_pos[(t, 0)][0], top_y, 0.0) for t in types_order]
+    machine_bases = []
+    for name in machine_names:
+        x, y, _ = layout.machines[name].position
+        machine_bases.append((x, y, machine_top))
+
+    type_bar_obj, type_bar_mesh = add_queue_bars(viewer, "Queue_types", type_bases)
+    machine_bar_obj, machine_bar_mesh = add_queue_bars(viewer, "Queue_machines", machine_bases)
+    type_index = {t: i for i, t in enumerate(types_order)}
+    machine_index = {name: i for i, name in enumerate(machine_names)}
+
+    # 每種機台一個名稱標籤，跟著 bar 頂端移動（bar 高度 = QUEUE_BAR_BASE + 數量 × QUEUE_BAR_UNIT）；
+    # 沒有中文字型時改用 T1、T2 ...，對照表與數量寫在 side panel
+    font = find_label_font(types_order, lod_cfg.get("font"))
+    use_names = font is not None or all(str(t).isascii() for t in types_order)
+    labels = {t: str(t) if use_names else f"T{i+1}" for i, t in enumerate(types_order)}
+    if not use_names:
+        print("找不到中文字型，機台種類標籤改用 T1、T2 ...（可在 config 的 lod.font 指定字型檔）")
+
+    type_tags = {}
+    for t, (x, y, z) in zip(types_order, type_bases):
+        tag = Tag(labels[t], (x, y, z + QUEUE_BAR_BASE + 0.2), color=QUEUE_TAG_COLOR, height=30, font=font)
+        type_tags[t] = (tag, viewer.scene.add(tag, name=f"QueueTag_{t}", show=False))
+
+    # Tag 的文字改了要重建貼圖，數量改放在 side panel（Qt 文字，中文字與更新都便宜）
+    count_panel = Component()
+    count_panel.widget = QLabel()
+    viewer.ui.sidedock.add(count_panel)
+    panel = {"dirty": False}
+
+    def update_count_panel():
+        count_panel.widget.setText(format_queue_counts(counts, types_order, labels, machines_by_type))
+        panel["dirty"] = False
+
+    update_count_panel()
+
+    def update_type_bars(types):
+        for t in types:
+            i = type_index.get(t)
+            if i is None:
+                continue   # route 裡沒有對應機台的 type，沒有欄可以畫
+            x, y, z = type_bases[i]
+            count = counts.waiting.get(t, 0)
+            set_queue_bar(type_bar_mesh, i, type_bases[i], count)
+            type_tags[t][0].position = Point(x, y, z + QUEUE_BAR_BASE + count * QUEUE_BAR_UNIT + 0.2)
+        type_bar_obj.update(update_data=True)
+
+    def update_machine_bars(names):
+        for name in names:
+            i = machine_index[name]
+            set_queue_bar(machine_bar_mesh, i, machine_bases[i], counts.at_machine[name])
+        machine_bar_obj.update(update_data=True)
+
+    # 機台 box 三種模式都顯示（保留機台位置，顏色就是 heatmap）；
+    # 逐欄地板與 timeline strip 只在 OVERVIEW 收起；queue bar 只在不畫球時顯示
+    floor_objs = tile_objs + [strip_obj, cursor_obj]
+    bar_objs = [type_bar_obj, machine_bar_obj] + [obj for _, obj in type_tags.values()]
+
+    def apply_level(new_level):
+        # 只改 show 與原地更新，不新增 / 移除任何物件
+        spheres = new_level == DETAIL
+        overview = new_level == OVERVIEW
+        for obj in floor_objs:
+            obj.show = not overview
+        merged_floor_obj.show = overview
+        for obj in bar_objs:
+            obj.show = not spheres
+        for a in agents:
+            a.set_visible(spheres)
+
+        if not spheres:
+            update_type_bars(types_order)
+            update_machine_bars(machine_names)
+        if not overview:
+            redraw_heatmap()   # OVERVIEW 期間沒有更新 strip
+        counts.clear_dirty()
+        print(f"LOD：{new_level}")
+
+    apply_level(level)
+
+    # --------------------------------------------------------
+    # E. 動畫更新（回合制）
     # --------------------------------------------------------
     sim_time = 0.0
 
     @viewer.on(interval=50)
     def update(frame):
-        nonlocal sim_time
+        nonlocal sim_time, level
         dt = 0.05
         sim_time += dt
 
+        dispatch_tick(agents, dt, sim_time, machines_by_type)
+
         # -----------------------------
-        # Phase 1: 先讓正在加工的工件扣時間、完成就離開（釋放機台）
+        # 新事件：先給 utilization（arrive / release），再給 LOD 計數（會清空 list）
         # -----------------------------
-        for a in agents:
-            if a.state == "processing":
-                a.step(dt, sim_time, machines_by_type)
+        for e in events:
+            history.apply(e)
 
         # -----------------------------
-        # Phase 2: 再讓需要指派的工件進站（此時機台已經釋放）
+        # LOD：套用新事件；切換模式或只重畫有變動的 bar
         # -----------------------------
-        for a in agents:
-            if a.state == "need_assign":
-                a.try_assign(sim_time, machines_by_type)
+        counts.consume(events)
+        if counts.dirty_types or counts.dirty_machines:
+            panel["dirty"] = True
+        new_level = pick_level(level)
+        if new_level != level:
+            level = new_level
+            apply_level(level)
+        elif level != DETAIL:
+            if counts.dirty_types:
+                update_type_bars(counts.dirty_types)
+            if counts.dirty_machines:
+                update_machine_bars(counts.dirty_machines)
+            counts.clear_dirty()
+        else:
+            counts.clear_dirty()
 
         # -----------------------------
-        # Phase 3: 最後處理移動（畫面更新）
+        # 取樣 utilization，有新 bin 結算才重畫 heatmap
         # -----------------------------
-        for a in agents:
-            if a.state == "moving":
-                a.step(dt, sim_time, machines_by_type)
+        closed = history.sample(sim_time, dt)
+        if view["window"] in closed:
+            redraw_heatmap(strip=(level != OVERVIEW))
+        elif view["offset"] == 0 and frame % BOX_REFRESH_FRAMES == 0:
+            redraw_boxes()
+        if panel["dirty"] and frame % COUNT_PANEL_FRAMES == 0:
+            update_count_panel()   # 長視窗的格子很久才結算，box 的平均值仍要跟著現在時間走
 
         viewer.renderer.update()
 
@@ -0,0 +1,224 @@
+import argparse
+import json
+import math
+import random
+
+from grid_viewer import GAP_X, TILE_SIZE, get_types_order, load_config, machine_type, step_type
+
+
+# ============================================================
+# 幾何設定（與 grid_viewer 的欄距 / staging 區一致）
+# ============================================================
+COL_STEP = TILE_SIZE[0] + GAP_X
+STAGING_OFFSET = TILE_SIZE[0] * 0.9   # staging 區在第 0 欄左邊多遠
+
+STAGING = None                    # 路徑起點（staging 區）在 flow 圖中的代號
+
+
+# ============================================================
+# 寫設定檔
+# ============================================================
+
+def save_config(config, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(config, f, ensure_ascii=False, indent=2)
+
+
+# ============================================================
+# Flow 圖：把所有產品路徑壓成「type 之間的加權邊」
+# ============================================================
+
+def build_flow_weights(config, types_order):
+    """回傳 {type_or_STAGING: {type: weight}}（對稱）。
+
+    每個產品從 staging 出發，依 route 走過各 type；
+    每一段 (a -> b) 的 weight 加上該產品的 quantity。
+    route 裡找不到機台的 type 直接跳過，避免 KeyError。
+    """
+    known = set(types_order)
+    flow = {STAGING: {}}
+    for t in types_order:
+        flow[t] = {}
+
+    for p in config.get("products", []):
+        qty = float(p.get("quantity", 1))
+        prev = STAGING
+        for step in p.get("route", []):
+            t = step_type(step)
+            if t not in known:
+                continue
+            if t != prev:
+                flow[prev][t] = flow[prev].get(t, 0.0) + qty
+                flow[t][prev] = flow[t].get(prev, 0.0) + qty
+            prev = t
+    return flow
+
+
+# ============================================================
+# 成本：quantity 加權的移動距離
+# ============================================================
+
+class ColumnLayout:
+    def __init__(self, types_order, flow, col_step=COL_STEP, staging_offset=STAGING_OFFSET):
+        """
+        types_order: 目前的欄位順序（index = 欄）
+        flow: build_flow_weights 的結果
+        """
+        self.order = list(types_order)
+        self.col = {t: i for i, t in enumerate(self.order)}
+        self.flow = flow
+        self.col_step = float(col_step)
+        self.staging_x = -float(staging_offset)
+
+    def x(self, t):
+        if t is STAGING:
+            return self.staging_x
+        return self.col[t] * self.col_step
+
+    def total_cost(self):
+        """完整重算一次（O(邊數)），用來初始化與驗證。"""
+        cost = 0.0
+        for a, nbrs in self.flow.items():
+            for b, w in nbrs.items():
+                cost += w * abs(self.x(a) - self.x(b))
+        return cost / 2.0   # 對稱邊算了兩次
+
+    def swap_delta(self, a, b):
+        """交換 type a 與 type b 的欄位後，成本的變化量。
+
+        只看和 a、b 相連的邊（O(路徑長度)），不必重算整個 layout。
+        """
+        xa, xb = self.x(a), self.x(b)
+        delta = 0.0
+        for t, xt_new, xt_old, other in ((a, xb, xa, b), (b, xa, xb, a)):
+            for u, w in self.flow[t].items():
+                if u == other:
+                    continue   # a-b 之間的距離交換後不變
+                xu = self.x(u)
+                delta += w * (abs(xt_new - xu) - abs(xt_old - xu))
+        return delta
+
+    def swap(self, a, b):
+        ia, ib = self.col[a], self.col[b]
+        self.order[ia], self.order[ib] = b, a
+        self.col[a], self.col[b] = ib, ia
+
+
+# ============================================================
+# 搜尋：swap local search / simulated annealing
+# ============================================================
+
+def local_search(layout, max_rounds=100):
+    """First-improvement 的兩兩交換，直到沒有任何交換能降低成本。"""
+    cost = layout.total_cost()
+    n = len(layout.order)
+    for _ in range(max_rounds):
+        improved = False
+        for i in range(n):
+            for j in range(i + 1, n):
+                a, b = layout.order[i], layout.order[j]
+                d = layout.swap_delta(a, b)
+                if d < -1e-9:
+                    layout.swap(a, b)
+                    cost += d
+                    improved = True
+        if not improved:
+            break
+    return cost
+
+
+def simulated_annealing(layout, iters=20000, t0=None, cooling=0.9995, seed=None):
+    """隨機交換兩欄；變差的交換以 exp(-delta / T) 的機率接受。
+
+    回傳 (best_cost, best_order)。
+    """
+    rng = random.Random(seed)
+    n = len(layout.order)
+    cost = layout.total_cost()
+    best_cost, best_order = cost, list(layout.order)
+    if n < 2:
+        return best_cost, best_order
+
+    # 起始溫度：預設取一次交換的典型成本尺度
+    if t0 is None:
+        t0 = max(cost / max(n, 1), 1e-6)
+    temp = t0
+
+    for _ in range(iters):
+        i, j = rng.sample(range(n), 2)
+        a, b = layout.order[i], layout.order[j]
+        d = layout.swap_delta(a, b)
+        if d <= 0 or rng.random() < math.exp(-d / temp):
+            layout.swap(a, b)
+            cost += d
+            if cost < best_cost - 1e-9:
+                best_cost, best_order = cost, list(layout.order)
+        temp = max(temp * cooling, 1e-9)
+
+    return best_cost, best_order
+
+
+def optimize_layout(config, method="anneal", iters=20000, seed=None):
+    """回傳 (best_order, initial_cost, best_cost)。
+
+    method: "anneal"（simulated annealing 後再做 local search 收尾）
+            或 "swap"（只做 local search）。
+    """
+    types_order = get_types_order(config)
+    flow = build_flow_weights(config, types_order)
+    layout = ColumnLayout(types_order, flow)
+    initial_cost = layout.total_cost()
+
+    if method == "anneal":
+        _, best_order = simulated_annealing(layout, iters=iters, seed=seed)
+        layout = ColumnLayout(best_order, flow)
+        best_cost = local_search(layout)
+    elif method == "swap":
+        best_cost = local_search(layout)
+    else:
+        raise ValueError(f"未知的 method：{method}（可用 anneal / swap）")
+
+    return list(layout.order), initial_cost, best_cost
+
+
+def apply_types_order(config, types_order):
+    """把欄位順序寫回 config：依新的 type 順序重排 machines（同 type 內保持原順序）。
+
+    grid_viewer 依 machines 中 type 第一次出現的順序決定欄位，所以這樣就能直接讀。
+    """
+    rank = {t: i for i, t in enumerate(types_order)}
+    machines = config.get("machines", [])
+    out = dict(config)
+    out["machines"] = sorted(machines, key=lambda m: rank.get(machine_type(m), len(rank)))
+    return out
+
+
+# ============================================================
+# 命令列（headless）
+# ============================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="最佳化機台欄位順序（quantity 加權移動距離）")
+    parser.add_argument("config", nargs="?", default="config.json")
+    parser.add_argument("-o", "--output", default="config_optimized.json", help="輸出檔（預設 config_optimized.json）")
+    parser.add_argument("--method", choices=["anneal", "swap"], default="anneal")
+    parser.add_argument("--iters", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    best_order, initial_cost, best_cost = optimize_layout(
+        config, method=args.method, iters=args.iters, seed=args.seed
+    )
+
+    print("原本欄位順序:", get_types_order(config))
+    print("最佳欄位順序:", best_order)
+    print(f"移動距離：{initial_cost:.2f} -> {best_cost:.2f}")
+
+    save_config(apply_types_order(config, best_order), args.output)
+    print("已輸出:", args.output)
+    print("用 viewer 檢視:", f"python grid_viewer.py {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# ============================================================
+# Level of detail：大量工件 / 大網格時，改畫每台機台的彙總量
+# ============================================================
+
+DETAIL = "detail"          # 每顆工件一顆球
+AGGREGATE = "aggregate"    # 工件改畫 queue bar；地板、機台 box、timeline strip 照常
+OVERVIEW = "overview"      # 鏡頭拉遠：再把地板合併、收起 timeline strip（機台 box 保留）
+
+# 鏡頭距離切換的緩衝帶，避免在門檻附近來回閃爍
+HYSTERESIS = 0.1
+
+
+def choose_level(current, agent_count, camera_distance, agent_threshold, distance_threshold):
+    """依工件數與鏡頭距離決定 DETAIL / AGGREGATE / OVERVIEW。
+
+    鏡頭距離達到 distance_threshold 用 OVERVIEW（已經是 OVERVIEW 時要拉近到門檻的
+    (1 - HYSTERESIS) 才切回）；否則工件數達到 agent_threshold 用 AGGREGATE，
+    所以工件很多時拉近鏡頭仍看得到 timeline strip 與逐欄地板。
+    """
+    if distance_threshold is not None and camera_distance is not None:
+        limit = distance_threshold * (1 - HYSTERESIS) if current == OVERVIEW else distance_threshold
+        if camera_distance >= limit:
+            return OVERVIEW
+    if agent_threshold is not None and agent_count >= agent_threshold:
+        return AGGREGATE
+    return DETAIL
+
+
+class QueueCounts:
+    def __init__(self, layout):
+        """
+        以派工事件增量維護彙總量，不必每一幀掃過所有工件：
+        - waiting: {type: 等待指派到該種機台的工件數}
+        - at_machine: {machine_name: 已指派、正在前往或加工中的工件數}
+        - at_type: {type: 該種所有機台的 at_machine 合計}
+
+        dirty_types / dirty_machines 記錄上次 clear_dirty 之後有變動的 key，
+        畫面只需要重畫這些。
+        """
+        self.machine_type = {name: m.type for name, m in layout.machines.items()}
+        self.waiting = {}
+        self.at_machine = {name: 0 for name in layout.machines}
+        self.at_type = {t: 0 for t in self.machine_type.values()}
+
+        self._route = {}    # wid -> [type, ...]
+        self._step = {}     # wid -> 目前第幾站
+
+        self.dirty_types = set()
+        self.dirty_machines = set()
+
+    def add_agents(self, agents):
+        for a in agents:
+            if a.wid in self._route:
+                raise ValueError(f"工件 id 重複：{a.wid}（計數以 id 為 key，必須唯一）")
+            self._route[a.wid] = [step["type"] for step in a.route_steps]
+            self._step[a.wid] = a.step_index
+            self._enqueue(a.wid)
+
+    def _enqueue(self, wid):
+        route = self._route[wid]
+        i = self._step[wid]
+        if i < len(route):
+            t = route[i]
+            self.waiting[t] = self.waiting.get(t, 0) + 1
+            self.dirty_types.add(t)
+
+    def apply(self, event):
+        """套用一筆 WorkpieceAgent 事件 (time, wid, event, machine_name)。"""
+        _, wid, kind, machine = event
+        if kind == "assign":
+            t = self.machine_type[machine]
+            self.waiting[t] -= 1
+            self.at_machine[machine] += 1
+            self.at_type[t] += 1
+            self.dirty_types.add(t)
+            self.dirty_machines.add(machine)
+        elif kind == "release":
+            t = self.machine_type[machine]
+            self.at_machine[machine] -= 1
+            self.at_type[t] -= 1
+            self.dirty_types.add(t)
+            self.dirty_machines.add(machine)
+            self._step[wid] += 1
+            self._enqueue(wid)
+
+    def consume(self, events):
+        """套用新事件後清空 list（記憶體不隨模擬時間成長）。"""
+        for e in events:
+            self.apply(e)
+        events.clear()
+
+    def clear_dirty(self):
+        self.dirty_types.clear()
+        self.dirty_machines.clear()
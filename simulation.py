@@ -0,0 +1,272 @@
+import argparse
+import heapq
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from grid_viewer import (
+    build_layout_by_type_grid,
+    create_agents,
+    dispatch_tick,
+    group_layout_by_type,
+    load_config,
+    step_type,
+)
+
+
+DT = 0.05                 # 與 grid_viewer 動畫相同的回合長度
+MAX_TIME = 24 * 3600.0    # 安全上限：避免派工卡住時永遠跑不完
+
+# 同一回合內事件在 dispatch_tick 的 phase：加工完離開 → 指派 → 抵達
+# （"finished" 緊跟在同一工件同時間的 release 後面時屬於 phase 0，否則是 phase 1 的空 route）
+EVENT_PHASE = {"release": 0, "finished": 0, "assign": 1, "arrive": 2}
+
+
+# ============================================================
+# 分區：product route / machine type 圖的 connected components
+# ============================================================
+
+def find_independent_cells(config):
+    """把產品依「是否共用機台種類」分組，回傳 [(product_indices, types), ...]。
+
+    兩個產品只要 route 中有任何一個相同的 type，就屬於同一個 cell；
+    不同 cell 之間不共用任何機台，可以各自獨立模擬。
+    """
+    parent = {}
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(a, b):
+        ra, rb = find(a), find(b)
+        if ra != rb:
+            parent[rb] = ra
+
+    products = config.get("products", [])
+    for pi, p in enumerate(products):
+        node = ("product", pi)
+        parent.setdefault(node, node)
+        for step in p.get("route", []):
+            t = ("type", step_type(step))
+            parent.setdefault(t, t)
+            union(node, t)
+
+    cells = {}
+    for pi in range(len(products)):
+        cells.setdefault(find(("product", pi)), []).append(pi)
+
+    out = []
+    for root, product_indices in cells.items():
+        types = sorted(
+            {node[1] for node in parent if node[0] == "type" and find(node) == root},
+            key=str,
+        )
+        out.append((product_indices, types))
+
+    # 依第一個產品出現的順序排，結果穩定
+    out.sort(key=lambda cell: cell[0][0])
+    return out
+
+
+def find_invalid_routes(config, machine_types):
+    """回傳 [(product_name, step_type), ...]：route 中沒有任何對應機台的站。
+
+    這種工件永遠等不到機台，會一直跑到 MAX_TIME，所以模擬前先擋下來。
+    """
+    known = set(machine_types)
+    bad = []
+    for pi, p in enumerate(config.get("products", [])):
+        for step in p.get("route", []):
+            t = step_type(step)
+            if t not in known:
+                bad.append((p.get("name", f"P{pi+1}"), t))
+    return bad
+
+
+# ============================================================
+# 單一 cell 的 headless 模擬（在 worker process 裡跑）
+# ============================================================
+
+def simulate_cell(config, product_indices, dt=DT, max_time=MAX_TIME):
+    """只模擬 product_indices 這些產品，回傳 {"metrics": ..., "events": [...], "ranks": {...}}。
+
+    layout 仍用完整 config 建立，機台位置（移動時間）與單執行緒模擬完全相同。
+    ranks: {wid: 工件在完整 config 中的建立順序}，合併事件時用來排同一時間的事件。
+    """
+    layout, types_order, _, _ = build_layout_by_type_grid(config)
+    machines_by_type = group_layout_by_type(layout)
+
+    events = []
+    agents = create_agents(
+        config,
+        layout,
+        types_order,
+        None,
+        product_indices=product_indices,
+        events=events,
+        verbose=False,
+    )
+
+    # create_agents 依 product_indices、quantity 的順序產生工件
+    products = config.get("products", [])
+    offsets = [0]
+    for p in products:
+        offsets.append(offsets[-1] + int(p.get("quantity", 1)))
+    ranks = {}
+    j = 0
+    for pi in product_indices:
+        for k in range(int(products[pi].get("quantity", 1))):
+            ranks[agents[j].wid] = offsets[pi] + k
+            j += 1
+
+    sim_time = 0.0
+    while sim_time < max_time and any(a.state != "finished" for a in agents):
+        sim_time += dt
+        dispatch_tick(agents, dt, sim_time, machines_by_type)
+
+    return {"metrics": _cell_metrics(events, agents, sim_time), "events": events, "ranks": ranks}
+
+
+def _cell_metrics(events, agents, sim_time):
+    finished_at = {}
+    machine_jobs = {}
+    machine_busy = {}
+    arrived_at = {}
+
+    for now, wid, event, machine in events:
+        if event == "assign":
+            machine_jobs[machine] = machine_jobs.get(machine, 0) + 1
+        elif event == "arrive":
+            arrived_at[wid] = now
+        elif event == "release":
+            machine_busy[machine] = machine_busy.get(machine, 0.0) + (now - arrived_at.pop(wid))
+        elif event == "finished":
+            finished_at[wid] = now
+
+    return {
+        "sim_time": sim_time,
+        "makespan": max(finished_at.values(), default=0.0),
+        "workpieces": len(agents),
+        "unfinished": [a.wid for a in agents if a.state != "finished"],
+        "finished_at": finished_at,
+        "machine_jobs": machine_jobs,
+        "machine_busy": machine_busy,
+    }
+
+
+# ============================================================
+# 合併各 cell 結果
+# ============================================================
+
+def _keyed_events(result):
+    """替一個 cell 的事件加上排序 key：(時間, phase, 工件建立順序, cell 內順序)。
+
+    單一程序模擬時，同一回合的事件依 phase、再依工件順序產生；
+    用同樣的 key 合併，結果就和單一程序的事件紀錄逐筆相同。
+    """
+    ranks = result["ranks"]
+    last = {}
+    for i, e in enumerate(result["events"]):
+        now, wid, kind, _ = e
+        if kind == "finished":
+            phase = 0 if last.get(wid) == (now, "release") else 1
+        else:
+            phase = EVENT_PHASE[kind]
+        last[wid] = (now, kind)
+        yield (now, phase, ranks[wid], i), e
+
+
+def merge_results(results):
+    """metrics：時間取最大、清單 / dict 合併；events：依 _keyed_events 的 key 合併。"""
+    metrics = {
+        "sim_time": 0.0,
+        "makespan": 0.0,
+        "workpieces": 0,
+        "unfinished": [],
+        "finished_at": {},
+        "machine_jobs": {},
+        "machine_busy": {},
+    }
+    for r in results:
+        m = r["metrics"]
+        metrics["sim_time"] = max(metrics["sim_time"], m["sim_time"])
+        metrics["makespan"] = max(metrics["makespan"], m["makespan"])
+        metrics["workpieces"] += m["workpieces"]
+        metrics["unfinished"].extend(m["unfinished"])
+        for key in ("finished_at", "machine_jobs", "machine_busy"):
+            metrics[key].update(m[key])
+
+    merged = heapq.merge(*(_keyed_events(r) for r in results), key=lambda ke: ke[0])
+    events = [e for _, e in merged]
+    return {"metrics": metrics, "events": events, "cells": len(results)}
+
+
+def simulate(config, processes=None, dt=DT, max_time=MAX_TIME):
+    """分區平行模擬：每個獨立 cell 丟到一個 worker process，最後合併。
+
+    processes: worker 數（None = CPU 核心數）；只有一個 cell 或 processes=1 時直接在本程序跑。
+    route 中有沒有對應機台的 type 時丟 ValueError（不送出任何 cell）。
+    """
+    layout, _, _, _ = build_layout_by_type_grid(config)
+    bad = find_invalid_routes(config, {m.type for m in layout.machines.values()})
+    if bad:
+        lines = "\n".join(f"  {name}: {t}" for name, t in bad)
+        raise ValueError(f"route 中有沒有對應機台的 type（產品: type）：\n{lines}")
+
+    cells = find_independent_cells(config)
+    if processes is None:
+        processes = os.cpu_count() or 1
+    processes = max(1, min(processes, len(cells)))
+
+    if processes == 1:
+        results = [simulate_cell(config, pis, dt, max_time) for pis, _ in cells]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            futures = [pool.submit(simulate_cell, config, pis, dt, max_time) for pis, _ in cells]
+            results = [f.result() for f in futures]
+
+    merged = merge_results(results)
+    merged["cell_types"] = [types for _, types in cells]
+    return merged
+
+
+# ============================================================
+# 命令列（headless）
+# ============================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="分區平行模擬（不開 viewer）")
+    parser.add_argument("config", nargs="?", default="config.json")
+    parser.add_argument("-j", "--processes", type=int, default=None)
+    parser.add_argument("--events", default=None, help="把事件紀錄輸出成 JSON")
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    try:
+        result = simulate(config, processes=args.processes)
+    except ValueError as e:
+        parser.error(str(e))
+    metrics = result["metrics"]
+
+    print("獨立 cell 數:", result["cells"])
+    for i, types in enumerate(result["cell_types"]):
+        print(f"  cell {i}: {types}")
+    print("總工件數:", metrics["workpieces"])
+    print(f"makespan: {metrics['makespan']:.2f}s")
+    for name in sorted(metrics["machine_jobs"]):
+        busy = metrics["machine_busy"].get(name, 0.0)
+        print(f"  {name}: jobs={metrics['machine_jobs'][name]}, busy={busy:.2f}s")
+    if metrics["unfinished"]:
+        print("未完成工件:", metrics["unfinished"])
+
+    if args.events:
+        with open(args.events, "w", encoding="utf-8") as f:
+            json.dump(result["events"], f, ensure_ascii=False)
+        print("事件紀錄已輸出:", args.events)
+
+
+if __name__ == "__main__":
+    main()
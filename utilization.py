@@ -0,0 +1,142 @@
+import numpy as np
+
+
+# ============================================================
+# 預設時間視窗（秒）：最近 60 秒 / 最近 10 分鐘 / 一個班次
+# ============================================================
+DEFAULT_WINDOWS = {
+    "60s": 60.0,
+    "10min": 600.0,
+    "shift": 8 * 3600.0,
+}
+
+# 每個視窗固定切成幾格（ring buffer 長度），記憶體不隨模擬時間成長
+DEFAULT_BINS = 60
+
+
+# ============================================================
+# Ring buffer：預先配置好的 NumPy 陣列，寫滿後覆蓋最舊的格子
+# ============================================================
+
+class RingBuffer:
+    def __init__(self, nrows, size):
+        """
+        nrows: 列數（= 機台數）
+        size: 格數（時間方向）
+        """
+        self.size = int(size)
+        self.data = np.zeros((nrows, self.size), dtype=np.float64)
+        self.times = np.full(self.size, np.nan, dtype=np.float64)
+        self.head = 0      # 下一個要寫入的位置
+        self.count = 0     # 已寫入幾格（最多 size）
+
+    def push(self, t, column):
+        self.data[:, self.head] = column
+        self.times[self.head] = t
+        self.head = (self.head + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+
+    def ordered(self):
+        """回傳 (times, data)，依時間由舊到新排列，只含已寫入的格子。"""
+        if self.count < self.size:
+            return self.times[:self.count], self.data[:, :self.count]
+        idx = np.roll(np.arange(self.size), -self.head)
+        return self.times[idx], self.data[:, idx]
+
+
+# ============================================================
+# 每台機台的 utilization 歷史（多個時間視窗）
+# ============================================================
+
+class UtilizationHistory:
+    def __init__(self, machine_names, windows=None, bins=DEFAULT_BINS):
+        """
+        machine_names: 機台名稱清單（決定列的順序）
+        windows: {視窗名稱: 秒數}，預設用 DEFAULT_WINDOWS
+        bins: 每個視窗切成幾格；每格長度 = 視窗秒數 / bins
+        """
+        self.machine_names = list(machine_names)
+        self.index = {name: i for i, name in enumerate(self.machine_names)}
+        self.windows = dict(windows if windows is not None else DEFAULT_WINDOWS)
+        self.bins = int(bins)
+
+        n = len(self.machine_names)
+        # 多存一個視窗的格子：游標往回拖時，游標之前仍有完整一個視窗可平均
+        self.buffers = {w: RingBuffer(n, 2 * self.bins) for w in self.windows}
+        self.bin_seconds = {w: float(sec) / self.bins for w, sec in self.windows.items()}
+
+        # 目前這一格還沒結算的累積量（忙碌秒數 / 經過秒數）
+        self._busy_acc = {w: np.zeros(n, dtype=np.float64) for w in self.windows}
+        self._time_acc = {w: 0.0 for w in self.windows}
+
+        # 每台機台正在加工的工件數（由 arrive / release 事件增量維護）
+        self._processing = np.zeros(n, dtype=np.int64)
+        self._busy = np.zeros(n, dtype=np.float64)
+
+    def apply(self, event):
+        """套用一筆 WorkpieceAgent 事件 (time, wid, event, machine_name)。
+
+        忙碌 = 工件抵達機台（arrive）到離開（release）之間，
+        與 simulation.py 的 machine_busy 定義相同；不用 busy_until，
+        因為 busy_until 從指派時就開始算，包含了工件移動的時間。
+        """
+        _, _, kind, machine = event
+        i = self.index.get(machine)
+        if i is None:
+            return
+        if kind == "arrive":
+            self._processing[i] += 1
+        elif kind == "release":
+            self._processing[i] -= 1
+
+    def sample(self, now, dt):
+        """每個模擬回合呼叫一次（先 apply 完這回合的事件）。
+
+        回傳這一回合有結算出新格子的視窗名稱清單（畫面可以只在此時重畫）。
+        """
+        busy = self._busy
+        busy[:] = self._processing > 0
+
+        closed = []
+        for w in self.windows:
+            self._busy_acc[w] += busy * dt
+            self._time_acc[w] += dt
+            if self._time_acc[w] >= self.bin_seconds[w]:
+                self.buffers[w].push(now, self._busy_acc[w] / self._time_acc[w])
+                self._busy_acc[w][:] = 0.0
+                self._time_acc[w] = 0.0
+                closed.append(w)
+        return closed
+
+    def window_utilization(self, window, offset=0):
+        """游標所在那一格往前一整個視窗的平均 utilization（給機台 Box 上色）。
+
+        offset = 0 是最新一格，1 是前一格 ...；offset = 0 時也算入還沒結算的那一格，
+        所以短時間內（例如 shift 視窗的前 8 分鐘）也有值。
+        模擬時間還不滿一個視窗時，只平均已經有資料的部分；完全沒有資料時回傳全 0。
+        """
+        buf = self.buffers[window]
+        offset = int(offset)
+        n = max(0, min(self.bins, buf.count - offset))
+        busy = np.zeros(len(self.machine_names), dtype=np.float64)
+        covered = 0.0
+
+        if offset == 0 and self._time_acc[window] > 0:
+            busy += self._busy_acc[window]
+            covered += self._time_acc[window]
+            n = min(n, self.bins - 1)   # 總長度不超過一個視窗
+
+        if n > 0:
+            cols = (buf.head - 1 - offset - np.arange(n)) % buf.size
+            busy += buf.data[:, cols].sum(axis=1) * self.bin_seconds[window]
+            covered += n * self.bin_seconds[window]
+
+        if covered <= 0:
+            return {name: 0.0 for name in self.machine_names}
+        busy /= covered
+        return {name: float(busy[i]) for i, name in enumerate(self.machine_names)}
+
+    def timeline(self, window):
+        """回傳 (times, matrix)：matrix 形狀為 (機台數, 已寫入格數)，由舊到新，最多 bins 格。"""
+        times, data = self.buffers[window].ordered()
+        return times[-self.bins:], data[:, -self.bins:]